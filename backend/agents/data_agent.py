@@ -22,7 +22,9 @@ class DataIntelligenceAgent:
         self.llm = ChatGroq(
             groq_api_key=os.getenv("GROQ_API_KEY"),
             model_name="llama-3.1-8b-instant",
-            temperature=0
+            temperature=0,
+            timeout=15,
+            max_retries=2
         )
         self.df = self.load_latest_data_from_db()
 
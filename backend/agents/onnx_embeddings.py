@@ -0,0 +1,67 @@
+import sys
+from typing import List
+
+import torch
+import torch.nn.functional as F
+from langchain_core.embeddings import Embeddings
+
+DEFAULT_MODEL_ID = "sentence-transformers/all-MiniLM-L6-v2"
+QUANTIZED_FILE_NAME = "model_quantized.onnx"
+# Matches SentenceTransformer max_seq_length for all-MiniLM-L6-v2.
+MAX_SEQ_LENGTH = 256
+
+
+def export_quantized_model(save_dir: str, model_id: str = DEFAULT_MODEL_ID) -> None:
+    """
+    Exports a sentence-transformers model to ONNX and quantizes it to int8
+    with dynamic quantization tuned for AVX-512 VNNI CPUs.
+    """
+    from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    from transformers import AutoTokenizer
+
+    model = ORTModelForFeatureExtraction.from_pretrained(model_id, export=True)
+    quantizer = ORTQuantizer.from_pretrained(model)
+    qconfig = AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+    quantizer.quantize(save_dir=save_dir, quantization_config=qconfig)
+    AutoTokenizer.from_pretrained(model_id).save_pretrained(save_dir)
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    Embeddings backed by an int8-quantized ONNX export of MiniLM, run with
+    ONNX Runtime. Produces mean-pooled, L2-normalized vectors like the
+    original sentence-transformers model.
+    """
+    def __init__(self, model_dir: str, batch_size: int = 128):
+        from optimum.onnxruntime import ORTModelForFeatureExtraction
+        from transformers import AutoTokenizer
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.model = ORTModelForFeatureExtraction.from_pretrained(
+            model_dir, file_name=QUANTIZED_FILE_NAME
+        )
+        self.batch_size = batch_size
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        inputs = self.tokenizer(
+            texts, padding=True, truncation=True, max_length=MAX_SEQ_LENGTH, return_tensors="pt"
+        )
+        with torch.no_grad():
+            token_embeddings = self.model(**inputs).last_hidden_state
+        mask = inputs["attention_mask"].unsqueeze(-1).to(token_embeddings.dtype)
+        pooled = (token_embeddings * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+        return F.normalize(pooled, p=2, dim=1).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        embeddings = []
+        for i in range(0, len(texts), self.batch_size):
+            embeddings.extend(self._embed_batch(texts[i:i + self.batch_size]))
+        return embeddings
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed_batch([text])[0]
+
+
+if __name__ == "__main__":
+    export_quantized_model(sys.argv[1] if len(sys.argv) > 1 else "backend/minilm_int8")
@@ -1,16 +1,33 @@
 from langchain_core.prompts import ChatPromptTemplate
 from pydantic import BaseModel, Field
+from typing import Literal, Optional
 from langchain_groq import ChatGroq
+from langchain_community.cache import SQLiteCache
+from langchain.globals import set_llm_cache
+from collections import OrderedDict
 import os
+import re
+import asyncio
 from dotenv import load_dotenv
 
+from agents.research_agent import KEYWORD_ROUTES, GROQ_TIMEOUT, GROQ_MAX_RETRIES, LLM_TIMEOUT
+
 load_dotenv()
 
+os.makedirs("backend/data", exist_ok=True)
+set_llm_cache(SQLiteCache(database_path="backend/data/langchain.db"))
+
+ROUTE_CACHE_SIZE = 1024
+# Only phrasings that unambiguously ask for a chart; bare words like "graph"
+# or "plot" also occur in research questions and are left to the LLM.
+DATA_KEYWORDS = re.compile(
+    r"^(plot|chart|graph|visuali[sz]e)\b|\b(bar|line|pie|scatter) (chart|plot|graph)\b", re.I
+)
+
 class RouteQuery(BaseModel):
     """Route a user query to the appropriate agent."""
-    destination: str = Field(
-        description="The destination agent, must be one of 'data' or 'research'.",
-        enum=["data", "research"]
+    destination: Literal["data", "research"] = Field(
+        description="The destination agent, must be one of 'data' or 'research'."
     )
 
 class OrchestrationAgent:
@@ -18,10 +35,13 @@ class OrchestrationAgent:
         self.llm = ChatGroq(
             temperature=0, 
             model_name="llama-3.1-8b-instant",
-            groq_api_key=os.getenv("GROQ_API_KEY")
+            groq_api_key=os.getenv("GROQ_API_KEY"),
+            timeout=GROQ_TIMEOUT,
+            max_retries=GROQ_MAX_RETRIES,
+            max_tokens=20
         )
 
-        structured_llm = self.llm.with_structured_output(RouteQuery)
+        structured_llm = self.llm.with_structured_output(RouteQuery, method="json_mode")
 
         system_prompt = """You are an expert at routing a user query to a 'data' agent or a 'research' agent based on the query.
 
@@ -29,6 +49,7 @@ class OrchestrationAgent:
 - The 'research' agent handles queries about understanding, summarizing, or finding information within text documents (like PDFs).
 
 You must route the user's query to either the 'data' or 'research' agent.
+Respond only with a JSON object of the form {{"destination": "data"}} or {{"destination": "research"}}.
 """
 
         prompt = ChatPromptTemplate.from_messages(
@@ -39,19 +60,38 @@ You must route the user's query to either the 'data' or 'research' agent.
         )
 
         self.chain = prompt | structured_llm
+        self._route_cache = OrderedDict()
 
-    def route_query(self, query: str) -> str:
+    async def route_query(self, query: str, loaded_agent: Optional[str] = None) -> str:
         """
-        Routes the user's query to the appropriate agent.
+        Routes the user's query to the appropriate agent. Requests that match
+        the loaded file type's keyword shortcuts and previously seen queries
+        are resolved without an LLM call.
         """
-        try:
-            response = self.chain.invoke({"query": query})
-            
-            print(f"[OrchestrationAgent] Query: {query}")
-            print(f"[OrchestrationAgent] Routed to: {response.destination}")
-            
-            return response.destination
-        except Exception as e:
-            print(f"Error routing query: {e}")
-            return "research"
+        normalized_query = " ".join(query.lower().split())
+        cache_key = (loaded_agent, normalized_query)
+        if cache_key in self._route_cache:
+            self._route_cache.move_to_end(cache_key)
+            return self._route_cache[cache_key]
+
+        if loaded_agent == "data" and DATA_KEYWORDS.search(normalized_query):
+            destination = "data"
+        elif loaded_agent == "research" and any(
+            pattern.search(normalized_query) for pattern, _ in KEYWORD_ROUTES
+        ):
+            destination = "research"
+        else:
+            try:
+                response = await asyncio.wait_for(self.chain.ainvoke({"query": query}), timeout=LLM_TIMEOUT)
+                destination = response.destination
+            except Exception as e:
+                print(f"Error routing query: {e}")
+                return "research"
+
+        print(f"[OrchestrationAgent] Query: {query}")
+        print(f"[OrchestrationAgent] Routed to: {destination}")
 
+        self._route_cache[cache_key] = destination
+        if len(self._route_cache) > ROUTE_CACHE_SIZE:
+            self._route_cache.popitem(last=False)
+        return destination
@@ -0,0 +1,38 @@
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz
+
+PARALLEL_PDF_MIN_PAGES = 100
+PDF_PAGES_PER_WORKER = 50
+
+
+def _extract_pages(file_path: str, start: int, stop: int) -> str:
+    """Extracts the text of pages [start, stop) from a PDF."""
+    with fitz.open(file_path) as doc:
+        return "".join(doc[i].get_text() for i in range(start, stop))
+
+
+def extract_pdf_text(file_path: str) -> str:
+    """
+    Extracts the text of a PDF. Large PDFs are split into page ranges of at
+    least PDF_PAGES_PER_WORKER pages that are read in separate processes,
+    since PyMuPDF is not thread-safe. Workers are started from a forkserver
+    because the calling process is threaded. This module only imports fitz,
+    so each worker starts quickly.
+    """
+    with fitz.open(file_path) as doc:
+        page_count = doc.page_count
+        if page_count < PARALLEL_PDF_MIN_PAGES:
+            return "".join(page.get_text() for page in doc)
+
+    workers = max(1, min(os.cpu_count() or 1, page_count // PDF_PAGES_PER_WORKER))
+    step = (page_count + workers - 1) // workers
+    ranges = [(start, min(start + step, page_count)) for start in range(0, page_count, step)]
+    with ProcessPoolExecutor(
+        max_workers=len(ranges),
+        mp_context=multiprocessing.get_context("forkserver")
+    ) as executor:
+        futures = [executor.submit(_extract_pages, file_path, start, stop) for start, stop in ranges]
+        return "".join(future.result() for future in futures)
@@ -1,19 +1,123 @@
 import os
-import fitz
+import re
+import hashlib
+import asyncio
+from functools import lru_cache
+import torch
 from dotenv import load_dotenv
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_chroma import Chroma
+from langchain_community.embeddings import InfinityEmbeddings
+from langchain_community.vectorstores import FAISS
 from langchain_groq import ChatGroq
-from langchain.chains.summarize import load_summarize_chain
 from langchain.chains import ConversationalRetrievalChain
 from pydantic import BaseModel, Field
-from typing import List, Dict
+from typing import List, Dict, Literal, Optional, Tuple
 from docx import Document
 from langchain_core.prompts import ChatPromptTemplate 
 
+from agents.onnx_embeddings import OnnxEmbeddings
+from agents.pdf_text import extract_pdf_text
+
 load_dotenv()
 
+EMBED_BATCH_SIZE = 128
+GROQ_TIMEOUT = 15
+GROQ_MAX_RETRIES = 2
+# Outer bound for one chain call. It must cover every attempt the client
+# makes, plus its backoff between retries, or the retries never get to run.
+LLM_TIMEOUT = GROQ_TIMEOUT * (GROQ_MAX_RETRIES + 1) + 20
+# Completion-token limit of llama-3.1-8b-instant on Groq.
+MAX_COMPLETION_TOKENS = 8192
+SUMMARY_MAP_CONCURRENCY = 10
+SUMMARY_TOKEN_MAX = 3000
+VECTOR_STORE_DIR = "backend/vector_store"
+
+# Anchored to request phrasing so that questions which merely mention these
+# words ("what does the abstract say about ...") still reach Q&A.
+KEYWORD_ROUTES = [
+    (re.compile(r"^((summari[sz]e|give me|show me|what is|what's) )?(the )?abstract( of (the|this) (paper|document))?[.?!]?$", re.I), "abstract"),
+    (re.compile(r"^(summari[sz]e\b|(give|show) me (a |an )?((short|brief|quick) )?(summary|summaries|overview)\b|(list |what are )?the main points\b)", re.I), "summary"),
+    (re.compile(r"^((list|extract|give me|show me|what are) (the )?)?(key ?words?|key ?terms?)\b", re.I), "keywords"),
+]
+
+NUMBERED_LINE = re.compile(r"^\s*(\d+)[.)]\s*", re.M)
+
+
+_SPLITTER = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
+
+
+@lru_cache(maxsize=1)
+def _get_embeddings():
+    """Loads the embeddings model once per process and reuses it afterwards."""
+    infinity_api_url = os.getenv("INFINITY_API_URL")
+    if infinity_api_url:
+        return InfinityEmbeddings(
+            model=os.getenv("INFINITY_MODEL", "sentence-transformers/all-MiniLM-L6-v2"),
+            infinity_api_url=infinity_api_url
+        )
+
+    onnx_model_dir = os.getenv("ONNX_EMBEDDINGS_DIR")
+    if onnx_model_dir:
+        return OnnxEmbeddings(onnx_model_dir, batch_size=EMBED_BATCH_SIZE)
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    model_kwargs = {"device": device}
+    if device == "cuda":
+        model_kwargs["model_kwargs"] = {"torch_dtype": torch.float16}
+    return HuggingFaceEmbeddings(
+        model_name="all-MiniLM-L6-v2",
+        model_kwargs=model_kwargs,
+        encode_kwargs={"batch_size": EMBED_BATCH_SIZE}
+    )
+
+
+def _split_numbered_answers(text: str, count: int) -> Optional[Tuple[str, List[str]]]:
+    """
+    Splits a reply of the form "1. ... 2. ..." into any preamble before "1."
+    and its numbered parts. Returns None unless exactly the numbers 1..count
+    are present.
+    """
+    matches = list(NUMBERED_LINE.finditer(text))
+    numbers = [int(m.group(1)) for m in matches]
+    if numbers != list(range(1, count + 1)):
+        return None
+    preamble = text[:matches[0].start()].strip()
+    ends = [m.start() for m in matches[1:]] + [len(text)]
+    return preamble, [text[m.end():end].strip() for m, end in zip(matches, ends)]
+
+
+def _group_by_token_budget(texts: List[str], count_tokens, budget: int) -> List[List[str]]:
+    """
+    Packs consecutive texts into groups whose combined token count stays
+    within budget. A text larger than the budget gets a group of its own.
+    """
+    groups, current, current_tokens = [], [], 0
+    for text in texts:
+        tokens = count_tokens(text)
+        if current and current_tokens + tokens > budget:
+            groups.append(current)
+            current, current_tokens = [], 0
+        current.append(text)
+        current_tokens += tokens
+    if current:
+        groups.append(current)
+    return groups
+
+
+async def _gather_or_cancel(coros) -> list:
+    """
+    Like asyncio.gather, but cancels the remaining calls as soon as one fails
+    so they stop spending Groq quota after the caller has given up.
+    """
+    tasks = [asyncio.ensure_future(coro) for coro in coros]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
 
 class Keywords(BaseModel):
     """A list of important keywords extracted from a document."""
@@ -23,9 +127,8 @@ class Keywords(BaseModel):
 
 class ResearchQueryType(BaseModel):
     """Classifies the user's query to determine the correct action."""
-    category: str = Field(
-        description="The type of query, must be one of 'summary', 'keywords', 'abstract', or 'question'.",
-        enum=["summary", "keywords", "abstract", "question"]
+    category: Literal["summary", "keywords", "abstract", "question"] = Field(
+        description="The type of query, must be one of 'summary', 'keywords', 'abstract', or 'question'."
     )
 
 class ResearchAgent:
@@ -37,62 +140,146 @@ class ResearchAgent:
         self.llm = ChatGroq(
             groq_api_key=os.getenv("GROQ_API_KEY"),
             model_name="llama-3.1-8b-instant",
-            temperature=0
+            temperature=0,
+            timeout=GROQ_TIMEOUT,
+            max_retries=GROQ_MAX_RETRIES,
+            max_tokens=512
         )
+        self.classifier_llm = ChatGroq(
+            groq_api_key=os.getenv("GROQ_API_KEY"),
+            model_name="llama-3.1-8b-instant",
+            temperature=0,
+            timeout=GROQ_TIMEOUT,
+            max_retries=GROQ_MAX_RETRIES,
+            max_tokens=20
+        )
+        self.embeddings_model = _get_embeddings()
         self.vector_db = None
-        persist_directory = "backend/vector_store"
-        if os.path.exists(persist_directory):
-            self.vector_db = Chroma(
-                persist_directory=persist_directory,
-                embedding_function=HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+        self._retriever = None
+        self._qa_chain = None
+        if os.path.exists(os.path.join(VECTOR_STORE_DIR, "index.faiss")):
+            self.vector_db = FAISS.load_local(
+                VECTOR_STORE_DIR,
+                self.embeddings_model,
+                allow_dangerous_deserialization=True
             )
-        self.docs = []
+            self._qa_chain = self._build_qa_chain()
+        self.doc_texts = []
+        self.doc_metas = []
+        self.doc_hash = None
+        self._answer_cache = {}
+        self._ingest_lock = asyncio.Lock()
 
-    def ingest_document(self, file_path: str, file_type: str) -> Dict[str, str]:
+    def _build_qa_chain(self) -> ConversationalRetrievalChain:
+        """
+        Builds the retriever and Q&A chain once the vector database exists;
+        both are reused for every question.
+        """
+        self._retriever = self.vector_db.as_retriever(
+            search_type="mmr",
+            search_kwargs={"k": 4, "fetch_k": 20, "lambda_mult": 0.5}
+        )
+        return ConversationalRetrievalChain.from_llm(
+            llm=self.llm,
+            retriever=self._retriever,
+            return_source_documents=False
+        )
+
+    def _copy_vector_db(self) -> FAISS:
+        """Returns an independent copy of the vector database. Blocking; run it in a thread."""
+        return FAISS.deserialize_from_bytes(
+            self.vector_db.serialize_to_bytes(),
+            self.embeddings_model,
+            allow_dangerous_deserialization=True
+        )
+
+    def _extract_text(self, file_path: str, file_type: str) -> str:
+        """Reads the raw text of a PDF or DOCX file. Blocking; run it in an executor."""
+        if file_type == 'pdf':
+            return extract_pdf_text(file_path)
+        doc = Document(file_path)
+        return "\n".join([para.text for para in doc.paragraphs])
+
+    async def ingest_document(self, file_path: str, file_type: str) -> Dict[str, str]:
         """
         Loads a PDF or DOCX file, splits it into chunks, and stores
-        it in a Chroma vector database.
+        it in a FAISS vector index persisted to disk. Chunks are embedded
+        in batches that are dispatched concurrently.
         """
+        if file_type not in ('pdf', 'docx'):
+            return {"type": "text", "message": "Unsupported file type."}
+
         try:
-            full_text = ""
-            if file_type == 'pdf':
-                doc = fitz.open(file_path)
-                full_text = "".join(page.get_text() for page in doc)
-                doc.close()
-            elif file_type == 'docx':
-                doc = Document(file_path)
-                full_text = "\n".join([para.text for para in doc.paragraphs])
-            else:
-                return {"type": "text", "message": "Unsupported file type."}
+            loop = asyncio.get_running_loop()
+            full_text = await loop.run_in_executor(None, self._extract_text, file_path, file_type)
 
             if not full_text.strip():
                 return {"type": "text", "message": "The document is empty."}
 
-            text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
-            self.docs = text_splitter.create_documents([full_text])
-            
-            embeddings_model = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-            persist_directory = "backend/vector_store"
-            
-            self.vector_db = Chroma.from_documents(
-                documents=self.docs,
-                embedding=embeddings_model,
-                persist_directory=persist_directory
-            )
+            doc_texts = _SPLITTER.split_text(full_text)
+            doc_metas = [{} for _ in doc_texts]
+            self.doc_hash = hashlib.sha1(full_text.encode()).hexdigest()
+            self.doc_texts = doc_texts
+            self.doc_metas = doc_metas
+
+            # Content-hash IDs make re-ingesting a chunk a no-op.
+            index_by_id = {}
+            for i, text in enumerate(doc_texts):
+                index_by_id.setdefault(hashlib.sha1(text.encode()).hexdigest(), i)
+            # Serializes ingests so that each one copies the index the previous one saved.
+            async with self._ingest_lock:
+                existing_ids = set()
+                if self.vector_db is not None:
+                    existing_ids = set(self.vector_db.index_to_docstore_id.values())
+                new_chunks = [
+                    (chunk_id, i) for chunk_id, i in index_by_id.items() if chunk_id not in existing_ids
+                ]
+                if not new_chunks:
+                    return {"type": "text", "message": "Document ingested and ready for analysis."}
+
+                # Group chunks of similar length into the same batch to keep padding low.
+                new_chunks.sort(key=lambda item: len(doc_texts[item[1]]))
+                ids = [chunk_id for chunk_id, _ in new_chunks]
+                texts = [doc_texts[i] for _, i in new_chunks]
+                metadatas = [doc_metas[i] for _, i in new_chunks]
+                batches = [
+                    texts[i:i + EMBED_BATCH_SIZE]
+                    for i in range(0, len(texts), EMBED_BATCH_SIZE)
+                ]
+
+                embeddings = await asyncio.gather(*[
+                    self.embeddings_model.aembed_documents(batch) for batch in batches
+                ])
+                text_embeddings = list(zip(texts, [vector for batch in embeddings for vector in batch]))
+
+                # Q&A searches the live index from executor threads, and FAISS does not
+                # allow writes during a search, so new chunks go into a copy that
+                # replaces the live index once it is saved.
+                if self.vector_db is None:
+                    vector_db = FAISS.from_embeddings(
+                        text_embeddings, self.embeddings_model, metadatas=metadatas, ids=ids
+                    )
+                else:
+                    vector_db = await asyncio.to_thread(self._copy_vector_db)
+                    vector_db.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+                await asyncio.to_thread(vector_db.save_local, VECTOR_STORE_DIR)
+                self.vector_db = vector_db
+                self._qa_chain = self._build_qa_chain()
             return {"type": "text", "message": "Document ingested and ready for analysis."}
         except Exception as e:
             print(f"Error during document ingestion: {e}")
             return {"type": "text", "message": f"Error ingesting the document: {e}"}
 
-    def handle_query(self, query: str) -> Dict[str, str]:
+    async def handle_query(self, query: str) -> Dict[str, str]:
         """
         Routes the user's query to the correct handler function based on its intent.
-        This is a smart router powered by a structured output LLM call.
+        Common phrasings are matched against KEYWORD_ROUTES; anything else is
+        classified by a structured output LLM call.
         """
         if self.vector_db is None:
             return {"type": "text", "message": "No document has been ingested yet."}
 
-        structured_llm = self.llm.with_structured_output(ResearchQueryType)
+        structured_llm = self.classifier_llm.with_structured_output(ResearchQueryType, method="json_mode")
         
         system_prompt = """You are an expert at classifying a user's query for a research agent.
 Classify the query into one of the following categories:
@@ -100,6 +287,7 @@ Classify the query into one of the following categories:
 - 'abstract': If the user specifically asks for the abstract.
 - 'keywords': If the user asks for keywords or key terms.
 - 'question': If the user is asking a specific question about the document's content. This is a fallback if no other category matches.
+Respond only with a JSON object of the form {{"category": "<category>"}}.
 """
         prompt = ChatPromptTemplate.from_messages([
             ("system", system_prompt),
@@ -109,48 +297,108 @@ Classify the query into one of the following categories:
         chain = prompt | structured_llm
         
         try:
-            query_type = chain.invoke({"query": query})
+            category = next(
+                (route for pattern, route in KEYWORD_ROUTES if pattern.search(query.strip())),
+                None
+            )
+            if category is None:
+                query_type = await asyncio.wait_for(chain.ainvoke({"query": query}), timeout=LLM_TIMEOUT)
+                category = query_type.category
             
-            if query_type.category == "summary":
-                return self.summarize_paper()
-            elif query_type.category == "keywords":
-                return self.extract_keywords()
-            elif query_type.category == "abstract":
-                return self.summarize_abstract()
-            else:
-                return self.answer_question(query)
+            if category == "summary":
+                return await self.summarize_paper()
+            elif category == "keywords":
+                return await self.extract_keywords()
+            elif category == "abstract":
+                return await self.summarize_abstract()
                 
         except Exception as e:
-            print(f"Error classifying research query: {e}. Defaulting to Q&A.")
-            return self.answer_question(query)
+            print(f"Error handling research query: {e}. Defaulting to Q&A.")
+
+        try:
+            return await self.answer_question(query)
+        except Exception as e:
+            print(f"Error answering research query: {e}")
+            return {"type": "text", "message": f"An error occurred while answering the question: {e}"}
 
-    def summarize_paper(self) -> Dict[str, str]:
+    async def summarize_paper(self) -> Dict[str, str]:
         """
-        Summarizes the entire document using a map-reduce chain to handle
-        documents of any size without exceeding token limits.
+        Summarizes the entire document with a map-reduce pipeline to handle
+        documents of any size without exceeding token limits. Chunk summaries
+        are collapsed in groups of at most SUMMARY_TOKEN_MAX tokens until they
+        fit in a single reduce call. Every level runs concurrently, limited by
+        SUMMARY_MAP_CONCURRENCY.
         """
-        summarize_chain = load_summarize_chain(self.llm, chain_type="map_reduce")
-        result = summarize_chain.invoke(self.docs)
-        return {"type": "text", "message": result["output_text"]}
+        if not self.doc_texts:
+            return {"type": "text", "message": "No document content available."}
+
+        cache_key = (self.doc_hash, "summary")
+        if cache_key in self._answer_cache:
+            return self._answer_cache[cache_key]
+
+        map_prompt = ChatPromptTemplate.from_messages([
+            ("system", "You are an expert summarizer. Write a concise summary of the following text."),
+            ("human", "Text: {text}")
+        ])
+        reduce_prompt = ChatPromptTemplate.from_messages([
+            ("system", "You are an expert summarizer. Combine the following partial summaries of a document into a single, coherent summary of the whole document."),
+            ("human", "Summaries: {text}")
+        ])
+        map_chain = map_prompt | self.llm
+        reduce_chain = reduce_prompt | self.llm
+
+        semaphore = asyncio.Semaphore(SUMMARY_MAP_CONCURRENCY)
+
+        async def run(chain, text: str) -> str:
+            async with semaphore:
+                result = await asyncio.wait_for(chain.ainvoke({"text": text}), timeout=LLM_TIMEOUT)
+                return result.content
+
+        summaries = await _gather_or_cancel([run(map_chain, text) for text in self.doc_texts])
 
-    def summarize_abstract(self) -> Dict[str, str]:
+        # Collapse level by level. The second condition stops the loop if a level cannot merge anything.
+        groups = _group_by_token_budget(summaries, self.llm.get_num_tokens, SUMMARY_TOKEN_MAX)
+        while len(groups) > 1 and len(groups) < len(summaries):
+            summaries = await _gather_or_cancel([
+                run(reduce_chain, "\n\n".join(group)) for group in groups
+            ])
+            groups = _group_by_token_budget(summaries, self.llm.get_num_tokens, SUMMARY_TOKEN_MAX)
+
+        message = await run(reduce_chain, "\n\n".join(summaries))
+        response = {"type": "text", "message": message}
+        self._answer_cache[cache_key] = response
+        return response
+
+    async def summarize_abstract(self) -> Dict[str, str]:
         """Summarizes just the first chunk, which usually contains the abstract."""
-        if not self.docs:
+        if not self.doc_texts:
             return {"type": "text", "message": "No document content available."}
+
+        cache_key = (self.doc_hash, "abstract")
+        if cache_key in self._answer_cache:
+            return self._answer_cache[cache_key]
         
         prompt = ChatPromptTemplate.from_messages([
             ("system", "You are an expert summarizer. Provide a detailed summary of the abstract from the following text."),
             ("human", "Text: {text}")
         ])
         chain = prompt | self.llm
-        result = chain.invoke({"text": self.docs[0].page_content})
-        return {"type": "text", "message": result.content}
+        result = await asyncio.wait_for(
+            chain.ainvoke({"text": self.doc_texts[0]}), timeout=LLM_TIMEOUT
+        )
+        response = {"type": "text", "message": result.content}
+        self._answer_cache[cache_key] = response
+        return response
 
-    def extract_keywords(self) -> Dict[str, str]:
+    async def extract_keywords(self) -> Dict[str, str]:
         """Extracts keywords using a structured output call to guarantee a valid list."""
-        if not self.docs:
+        if not self.doc_texts:
             return {"type": "text", "message": "No document content available."}
 
+        cache_key = (self.doc_hash, "keywords")
+        if cache_key in self._answer_cache:
+            return self._answer_cache[cache_key]
+
         structured_llm = self.llm.with_structured_output(Keywords)
         prompt = ChatPromptTemplate.from_messages([
             ("system", "You are an expert at extracting keywords from a research paper."),
@@ -158,18 +406,58 @@ Classify the query into one of the following categories:
         ])
         chain = prompt | structured_llm
         
-        text_for_keywords = " ".join([doc.page_content for doc in self.docs[:4]])
-        result = chain.invoke({"text": text_for_keywords})
+        text_for_keywords = " ".join(self.doc_texts[:4])
+        result = await asyncio.wait_for(chain.ainvoke({"text": text_for_keywords}), timeout=LLM_TIMEOUT)
         
-        return {"type": "text", "message": ", ".join(result.keywords)}
+        response = {"type": "text", "message": ", ".join(result.keywords)}
+        self._answer_cache[cache_key] = response
+        return response
 
-    def answer_question(self, question: str) -> Dict[str, str]:
-        """Answers a question using a retrieval chain and the vector database."""
-        qa_chain = ConversationalRetrievalChain.from_llm(
-            llm=self.llm,
-            retriever=self.vector_db.as_retriever(),
-            return_source_documents=True
+    async def answer_question(self, question: str) -> Dict[str, str]:
+        """
+        Answers a question using the shared retrieval chain and the vector database.
+        Several questions on separate lines are answered together in one request.
+        """
+        questions = [line.strip() for line in question.splitlines() if line.strip()]
+        if len(questions) > 1 and all(q.endswith("?") for q in questions):
+            return await self._answer_questions(questions)
+
+        result = await asyncio.wait_for(
+            self._qa_chain.ainvoke({"question": question, "chat_history": []}), timeout=LLM_TIMEOUT
         )
-        result = qa_chain.invoke({"question": question, "chat_history": []})
         return {"type": "text", "message": result["answer"]}
 
+    async def _answer_questions(self, questions: List[str]) -> Dict[str, str]:
+        """
+        Retrieves context for each question separately, then answers all of
+        them in one numbered LLM call and splits the numbered reply.
+        """
+        retrieved = await asyncio.gather(*[self._retriever.ainvoke(q) for q in questions])
+        context = "\n\n".join(
+            f"Context for question {i}:\n" + "\n".join(doc.page_content for doc in docs)
+            for i, docs in enumerate(retrieved, 1)
+        )
+        numbered = "\n".join(f"{i}. {q}" for i, q in enumerate(questions, 1))
+
+        prompt = ChatPromptTemplate.from_messages([
+            ("system", "Use the provided context to answer each question separately. "
+                       "Reply with a numbered list, numbered 1 to {count}, with one answer per question. "
+                       "If the context does not contain the answer, say that you don't know."),
+            ("human", "{context}\n\nQuestions:\n{questions}"),
+        ])
+        max_tokens = min(self.llm.max_tokens * len(questions), MAX_COMPLETION_TOKENS)
+        chain = prompt | self.llm.bind(max_tokens=max_tokens)
+        result = await asyncio.wait_for(
+            chain.ainvoke({"count": len(questions), "context": context, "questions": numbered}),
+            timeout=LLM_TIMEOUT
+        )
+
+        split = _split_numbered_answers(result.content, len(questions))
+        if split is None:
+            return {"type": "text", "message": result.content}
+
+        preamble, answers = split
+        sections = [preamble] if preamble else []
+        sections += [f"**{i}. {q}**\n{a}" for i, (q, a) in enumerate(zip(questions, answers), 1)]
+        return {"type": "text", "message": "\n\n".join(sections)}
+
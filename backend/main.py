@@ -4,6 +4,7 @@ import uuid
 import mimetypes
 from fastapi import FastAPI, UploadFile, File, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from dotenv import load_dotenv
 
@@ -49,11 +50,11 @@ async def upload_file(file: UploadFile = File(...)):
         with open(file_path, "wb") as buffer:
             shutil.copyfileobj(file.file, buffer)
         if file_ext in ["csv", "xlsx"]:
-            data_agent.load_data(file_path, file_ext, file.filename)
+            await run_in_threadpool(data_agent.load_data, file_path, file_ext, file.filename)
             current_agent_type = "data"
             return {"status": f"Data file '{file.filename}' processed successfully.", "file_name": file.filename}
         elif file_ext in ["pdf", "docx"]:
-            status = research_agent.ingest_document(file_path, file_ext)
+            status = await research_agent.ingest_document(file_path, file_ext)
             current_agent_type = "research"
             return {"status": f"Research file '{file.filename}' processed successfully.", "file_name": file.filename}
         else:
@@ -70,10 +71,10 @@ async def analyze_query(payload: QueryPayload):
         raise HTTPException(status_code=400, detail="No file uploaded. Please upload a file first.")
     file_name = payload.file_name 
     query = payload.query
-    destination = orchestrator.route_query(query)
+    destination = await orchestrator.route_query(query, current_agent_type)
     if destination == "data":
-        response = data_agent.handle_query(query)
+        response = await run_in_threadpool(data_agent.handle_query, query)
         return {"agent": "data", "response": response}
     elif destination == "research":
-        response = research_agent.handle_query(query)
+        response = await research_agent.handle_query(query)
         return {"agent": "research", "response": response}
@@ -1,9 +1,34 @@
 import streamlit as st
-import requests
+import httpx
 import os
+import hashlib
 import plotly.io as pio
 
 BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:8000")
+# Summaries of long documents can take minutes, so responses are awaited
+# without a read timeout unless one is configured.
+BACKEND_READ_TIMEOUT = float(os.getenv("BACKEND_READ_TIMEOUT", 0)) or None
+
+
+@st.cache_resource
+def _client() -> httpx.Client:
+    """A single pooled client shared across reruns so connections are kept alive."""
+    return httpx.Client(
+        base_url=BACKEND_URL,
+        http2=True,
+        timeout=httpx.Timeout(120.0, connect=10.0, read=BACKEND_READ_TIMEOUT)
+    )
+
+
+def _upload(name: str, mime: str, file):
+    """Streams a file to the backend without copying its bytes."""
+    file.seek(0)
+    files = {
+        'file': (name, file, mime)
+    }
+    response = _client().post("/upload_file", files=files)
+    return response.status_code, response.json()
+
 
 st.set_page_config(
     page_title="AI Agent",
@@ -87,18 +112,22 @@ if st.button("Upload"):
     if uploaded_file:
         with st.spinner(f"Uploading {uploaded_file.name}..."):
             try:
-                files = {
-                    'file': (uploaded_file.name, uploaded_file.getvalue(), uploaded_file.type)
-                }
-                response = requests.post(f"{BACKEND_URL}/upload_file", files=files)
-                if response.status_code == 200:
-                    result = response.json()
-                    st.session_state["uploaded_file_name"] = result.get("file_name")
-                    status_message = result.get("status")
-                    st.success(status_message)
+                digest = hashlib.sha256(uploaded_file.getbuffer()).hexdigest()
+                # The backend only holds the last file, so only skip re-sending that one.
+                if digest == st.session_state.get("uploaded_file_digest"):
+                    st.success(st.session_state.get("upload_status"))
                 else:
-                    st.error(f"Error: {response.status_code} - {response.json().get('detail', 'Unknown error')}")
-            except requests.exceptions.ConnectionError:
+                    st.session_state.pop("uploaded_file_digest", None)
+                    status_code, result = _upload(uploaded_file.name, uploaded_file.type, uploaded_file)
+                    if status_code == 200:
+                        st.session_state["uploaded_file_name"] = result.get("file_name")
+                        st.session_state["uploaded_file_digest"] = digest
+                        status_message = result.get("status")
+                        st.session_state["upload_status"] = status_message
+                        st.success(status_message)
+                    else:
+                        st.error(f"Error: {status_code} - {result.get('detail', 'Unknown error')}")
+            except httpx.ConnectError:
                 st.error("Connection error. Is the FastAPI backend running and accessible?")
             except Exception as e:
                 st.error(f"An unexpected error occurred: {e}")
@@ -118,7 +147,7 @@ if st.button("Analyze"):
                     "query": query,
                     "file_name": st.session_state.get("uploaded_file_name")
                 }
-                response = requests.post(f"{BACKEND_URL}/analyze_query", json=payload)
+                response = _client().post("/analyze_query", json=payload)
                 if response.status_code == 200:
                     result = response.json()
                     st.success(f"Response from {result.get('agent')} agent:")
@@ -140,7 +169,7 @@ if st.button("Analyze"):
                 else:
                     st.error(f"Error: {response.status_code} - {response.json().get('detail', 'Unknown error')}")
 
-            except requests.exceptions.ConnectionError:
+            except httpx.ConnectError:
                 st.error("Connection error. Is the FastAPI backend running and accessible?")
             except Exception as e:
                 st.error(f"An unexpected error occurred: {e}")